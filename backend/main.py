@@ -1,48 +1,127 @@
-from fastapi import FastAPI, HTTPException, Body
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import json
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+import asyncio
+import bisect
+import hashlib
+import logging
+import orjson
 import random
 from datetime import date, datetime
 from zoneinfo import ZoneInfo
 import os
-from supabase import create_client, Client
+import time
+import httpx
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
 # Supabase setup
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
+# Must be the service_role key: only that role may execute the leaderboard functions
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "")
+# Queue leaderboard submissions and write them in batches from a background task.
+# Only for long-lived servers: a serverless instance can be frozen before the queue drains
+LEADERBOARD_WRITE_BEHIND = os.environ.get("LEADERBOARD_WRITE_BEHIND", "") == "1"
 
-def get_supabase() -> Client | None:
-    """Get Supabase client"""
+def create_supabase_client() -> httpx.AsyncClient | None:
+    """Create an async client for Supabase's REST (PostgREST) API"""
     if SUPABASE_URL and SUPABASE_KEY:
-        return create_client(SUPABASE_URL, SUPABASE_KEY)
+        return httpx.AsyncClient(
+            base_url=f"{SUPABASE_URL}/rest/v1",
+            headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"},
+        )
     return None
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One client shared by every request
+    app.state.supabase = create_supabase_client()
+    app.state.supabase_loop = asyncio.get_running_loop()
+    writer = None
+    if app.state.supabase and LEADERBOARD_WRITE_BEHIND:
+        # Leaderboard submissions waiting to be written to the database
+        app.state.lb_queue = asyncio.Queue()
+        app.state.lb_in_flight = []
+        writer = asyncio.create_task(
+            leaderboard_writer(app.state.supabase, app.state.lb_queue, app.state.lb_in_flight)
+        )
+    yield
+    if writer:
+        # Write out anything still queued before shutting down
+        try:
+            await asyncio.wait_for(app.state.lb_queue.join(), timeout=LEADERBOARD_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            unwritten = app.state.lb_queue.qsize() + len(app.state.lb_in_flight)
+            logger.error("Shutting down with %d leaderboard entries unwritten", unwritten)
+        writer.cancel()
+    if app.state.supabase:
+        await app.state.supabase.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
+def get_supabase(request: Request) -> httpx.AsyncClient | None:
+    """Get the shared Supabase REST client"""
+    state = request.app.state
+    loop = asyncio.get_running_loop()
+    if getattr(state, "supabase_loop", None) is not loop:
+        # The lifespan didn't run, or this is a new event loop (some serverless hosts use
+        # one per invocation). Pooled connections belong to the loop that opened them,
+        # so the old client can't be reused
+        state.supabase = create_supabase_client()
+        state.supabase_loop = loop
+    return state.supabase
+
+TIMEZONE = ZoneInfo("America/New_York")
+
+# (monotonic timestamp, date, date key) of the last lookup; refreshed at most once a second
+_TODAY = (float("-inf"), None, "")
+
+def _current_day() -> tuple[float, date, str]:
+    global _TODAY
+    now = time.monotonic()
+    cached = _TODAY
+    if now - cached[0] < 1.0:
+        return cached
+    today = datetime.now(TIMEZONE).date()
+    cached = (now, today, today.isoformat())
+    _TODAY = cached
+    return cached
+
+def get_today() -> date:
+    """Get today's date in EST timezone"""
+    return _current_day()[1]
+
 def get_today_key():
     """Get today's date key in EST timezone"""
-    today = datetime.now(ZoneInfo("America/New_York")).date()
-    return today.isoformat()
+    return _current_day()[2]
+
+# Enable CORS for frontend (comma-separated list of origins)
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.environ.get("FRONTEND_ORIGIN", "http://localhost:5173").split(",")
+    if origin.strip()
+]
 
-# Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type"],
 )
 
 # Load words
 WORDS_FILE = os.path.join(os.path.dirname(__file__), "words.json")
 try:
-    with open(WORDS_FILE, "r") as f:
-        WORDS_LIST = [w.upper() for w in json.load(f)]
+    with open(WORDS_FILE, "rb", buffering=65536) as f:
+        # words.json is stored uppercase, so the parsed strings are used as-is
+        WORDS_LIST = tuple(orjson.loads(f.read()))
 except FileNotFoundError:
-    WORDS_LIST = ["SAMPLE", "SIMPLE", "SERVER", "BUTTER", "BETTER"] # Fallback
+    WORDS_LIST = ("SAMPLE", "SIMPLE", "SERVER", "BUTTER", "BETTER") # Fallback
 
-WORDS_SET = set(WORDS_LIST)
+WORDS_SET = frozenset(WORDS_LIST)
 
 # Game settings
 START_DATE = date(2024, 1, 1)
@@ -55,19 +134,48 @@ class GuessResponse(BaseModel):
     is_valid_word: bool
 
 class LeaderboardEntry(BaseModel):
-    name: str
-    tries: int
+    name: str = Field(min_length=1, max_length=20)
+    tries: int = Field(ge=1, le=7)
     won: bool
 
-def get_daily_word() -> str:
+# Today's word, cached so /guess doesn't re-seed the RNG on every request
+_DAILY = {"key": None, "word": None, "ords": None, "counts": None}
+
+def get_daily_target() -> dict:
+    """Get today's word along with its precomputed byte values and letter counts"""
+    global _DAILY
+    today_key = get_today_key()
+    daily = _DAILY
+    if daily["key"] == today_key:
+        return daily
+
     # Use current date in EST as seed to pick a random consistent word
-    today = datetime.now(ZoneInfo("America/New_York")).date()
+    today = date.fromisoformat(today_key)
     # Create a seeded random instance so it doesn't affect global random state
     rng = random.Random(today.toordinal())
     
-    if not WORDS_LIST:
-        return "NOWORD"
-    return rng.choice(WORDS_LIST)
+    word = rng.choice(WORDS_LIST) if WORDS_LIST else "NOWORD"
+
+    # Frequency of letters in target, indexed by ord(letter) - ord("A")
+    ords = word.encode("ascii")
+    counts = bytearray(26)
+    for code in ords:
+        counts[code - 65] += 1
+
+    # Swap in a fresh dict so concurrent readers never see a half-updated entry
+    daily = {"key": today_key, "word": word, "ords": ords, "counts": counts}
+    _DAILY = daily
+    return daily
+
+def json_response(content) -> Response:
+    """Encode a response with orjson, skipping FastAPI's jsonable_encoder round-trip"""
+    return Response(content=orjson.dumps(content), media_type="application/json")
+
+# Bodies that never change, encoded once. A fresh Response is still built per
+# request, since middleware mutates the headers of the response it's given
+_VALID_BODY = orjson.dumps({"is_valid": True})
+_NOT_VALID_BODY = orjson.dumps({"is_valid": False})
+_INVALID_WORD_BODY = orjson.dumps({"result": [], "is_valid_word": False})
 
 @app.get("/")
 def read_root():
@@ -75,15 +183,15 @@ def read_root():
 
 @app.get("/daily-word-check")
 def check_daily_word():
-    # Use current date in EST as seed
-    today = datetime.now(ZoneInfo("America/New_York")).date()
+    today = get_today()
     days_diff = (today - START_DATE).days
     return {"day_index": days_diff}
 
 @app.post("/validate")
 def validate_word(request: GuessRequest):
     guess = request.guess.upper()
-    return {"is_valid": guess in WORDS_SET}
+    body = _VALID_BODY if guess in WORDS_SET else _NOT_VALID_BODY
+    return Response(content=body, media_type="application/json")
 
 @app.post("/guess")
 def check_guess(request: GuessRequest):
@@ -95,77 +203,253 @@ def check_guess(request: GuessRequest):
     
     # Check if real word
     if guess not in WORDS_SET:
-         return {"result": [], "is_valid_word": False}
+         return Response(content=_INVALID_WORD_BODY, media_type="application/json")
+
+    daily = get_daily_target()
+    target = daily["word"]
 
-    target = get_daily_word()
+    # A solved puzzle is all greens; skip the letter-by-letter passes
+    if guess == target:
+        return json_response({"result": ["correct"] * 6, "is_valid_word": True, "solution": target})
     
     # 2. Logic for Green/Yellow/Gray
     # Initialize result array
     result = ["absent"] * 6
-    target_letters_count = {}
-    
-    # Count frequency of letters in target
-    for char in target:
-        target_letters_count[char] = target_letters_count.get(char, 0) + 1
+    # Compare letters as byte values rather than 1-char strings
+    guess_ords = guess.encode("ascii")
+    target_ords = daily["ords"]
+    # Copy the precomputed frequency of letters in target
+    target_letters_count = bytearray(daily["counts"])
     
     # First pass: Find Greens (correct position)
     for i in range(6):
-        if guess[i] == target[i]:
+        if guess_ords[i] == target_ords[i]:
             result[i] = "correct"
-            target_letters_count[guess[i]] -= 1
+            target_letters_count[guess_ords[i] - 65] -= 1
             
     # Second pass: Find Yellows (present but wrong position)
     for i in range(6):
         if result[i] == "correct":
             continue
             
-        letter = guess[i]
-        if target_letters_count.get(letter, 0) > 0:
+        idx = guess_ords[i] - 65
+        if target_letters_count[idx] > 0:
             result[i] = "present"
-            target_letters_count[letter] -= 1
+            target_letters_count[idx] -= 1
             
-    return {"result": result, "is_valid_word": True, "solution": target}
+    return json_response({"result": result, "is_valid_word": True, "solution": target})
+
+# Today's leaderboard, served from memory and re-fetched once it's older than LEADERBOARD_TTL seconds
+LEADERBOARD_TTL = 5.0
+LEADERBOARD_LIMIT = 100
+LEADERBOARD_COLUMNS = "name,tries,won"
+LEADERBOARD_BATCH_SIZE = 100
+LEADERBOARD_RETRY_MAX_DELAY = 60.0
+LEADERBOARD_SHUTDOWN_TIMEOUT = 10.0
+_LEADERBOARD = {"key": None, "entries": [], "fetched": float("-inf"), "body": b"", "etag": ""}
+# (event loop, lock) serializing refreshes so a slow, stale fetch can't overwrite a newer one
+_LEADERBOARD_LOCK = (None, None)
+# (date key, task) of the refresh GET requests are currently waiting on
+_LEADERBOARD_REFRESH = (None, None)
+
+def _leaderboard_lock() -> asyncio.Lock:
+    # An asyncio.Lock only works on one event loop, so make a new one if the loop changed
+    global _LEADERBOARD_LOCK
+    loop = asyncio.get_running_loop()
+    if _LEADERBOARD_LOCK[0] is not loop:
+        _LEADERBOARD_LOCK = (loop, asyncio.Lock())
+    return _LEADERBOARD_LOCK[1]
+
+def _cache_leaderboard(today_key: str, entries: list[dict], fetched: float) -> list[dict]:
+    # Callers must hold _leaderboard_lock(). The GET body and its ETag are built here,
+    # once per change, so unchanged reads skip encoding entirely
+    global _LEADERBOARD
+    body = orjson.dumps({"entries": entries, "date": today_key})
+    etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    _LEADERBOARD = {"key": today_key, "entries": entries, "fetched": fetched, "body": body, "etag": etag}
+    return entries
+
+def _is_fresh(cached: dict, today_key: str) -> bool:
+    return cached["key"] == today_key and time.monotonic() - cached["fetched"] < LEADERBOARD_TTL
+
+async def _refresh_leaderboard(supabase: httpx.AsyncClient, today_key: str) -> list[dict]:
+    # Callers must hold _leaderboard_lock()
+    response = await supabase.get("/leaderboard", params={
+        "select": LEADERBOARD_COLUMNS,
+        "date_key": f"eq.{today_key}",
+        # Sort by: won first (True before False), then by tries (ascending)
+        "order": "won.desc,tries.asc",
+        "limit": LEADERBOARD_LIMIT,
+    })
+    response.raise_for_status()
+    sorted_entries = response.json() or []
+    return _cache_leaderboard(today_key, sorted_entries, time.monotonic())
+
+async def _refresh_stale_leaderboard(supabase: httpx.AsyncClient, today_key: str):
+    async with _leaderboard_lock():
+        # A POST may have refreshed it while we waited
+        if not _is_fresh(_LEADERBOARD, today_key):
+            await _refresh_leaderboard(supabase, today_key)
+
+def _finish_refresh(task: asyncio.Task):
+    global _LEADERBOARD_REFRESH
+    if _LEADERBOARD_REFRESH[1] is task:
+        _LEADERBOARD_REFRESH = (None, None)
+    # Mark a failure as seen even if every waiter has gone away
+    if not task.cancelled():
+        task.exception()
+
+async def get_todays_leaderboard(supabase: httpx.AsyncClient, today_key: str) -> dict:
+    """Get the cached copy of today's leaderboard, re-fetching it once it's stale"""
+    global _LEADERBOARD_REFRESH
+    cached = _LEADERBOARD
+    if _is_fresh(cached, today_key):
+        return cached
+    # Concurrent requests share one refresh, and its failure, instead of each
+    # fetching in turn behind the lock
+    key, task = _LEADERBOARD_REFRESH
+    if key != today_key or task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(_refresh_stale_leaderboard(supabase, today_key))
+        _LEADERBOARD_REFRESH = (today_key, task)
+        task.add_done_callback(_finish_refresh)
+    await asyncio.shield(task)
+    return _LEADERBOARD
+
+def _leaderboard_sort_key(entry: dict) -> tuple[bool, int]:
+    return (not entry["won"], entry["tries"])
+
+async def merge_into_leaderboard(supabase: httpx.AsyncClient, today_key: str, new_entry: dict) -> list[dict]:
+    """Add a freshly submitted entry to the in-memory copy of today's leaderboard"""
+    async with _leaderboard_lock():
+        if _LEADERBOARD["key"] != today_key:
+            await _refresh_leaderboard(supabase, today_key)
+        cached = _LEADERBOARD
+        # A player has one row per day holding their best result, same as submit_scores()
+        name = new_entry["name"].lower()
+        previous = next((e for e in cached["entries"] if e["name"].lower() == name), None)
+        if previous and _leaderboard_sort_key(previous) <= _leaderboard_sort_key(new_entry):
+            return cached["entries"]
+        if previous:
+            # The database keeps the name as first submitted, so keep its casing too
+            new_entry = {**new_entry, "name": previous["name"]}
+        entries = [e for e in cached["entries"] if e is not previous]
+        bisect.insort(entries, new_entry, key=_leaderboard_sort_key)
+        del entries[LEADERBOARD_LIMIT:]
+        return _cache_leaderboard(today_key, entries, cached["fetched"])
+
+async def submit_score(supabase: httpx.AsyncClient, today_key: str, new_entry: dict) -> dict:
+    """Upsert one entry; the database keeps the player's best result for the day and returns it"""
+    response = await supabase.post(
+        "/rpc/submit_score",
+        params={"select": LEADERBOARD_COLUMNS},
+        json={
+            "p_name": new_entry["name"],
+            "p_tries": new_entry["tries"],
+            "p_won": new_entry["won"],
+            "p_date_key": today_key
+        },
+    )
+    response.raise_for_status()
+    return response.json()[0]
+
+def _is_retryable(error: Exception) -> bool:
+    # Network trouble and server errors may pass; anything else the database will reject again
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+async def _write_rows(supabase: httpx.AsyncClient, batch: list[dict]) -> list[dict]:
+    # One row at a time, so a row the database rejects doesn't take the rest down with it.
+    # Returns the rows worth retrying
+    retry = []
+    for item in batch:
+        try:
+            await submit_score(supabase, item["date_key"], item)
+        except Exception as e:
+            if _is_retryable(e):
+                retry.append(item)
+            else:
+                logger.error("Dropping leaderboard entry %r rejected by the database: %s", item, e)
+    return retry
+
+async def leaderboard_writer(supabase: httpx.AsyncClient, queue: asyncio.Queue, in_flight: list):
+    """Drain queued leaderboard submissions, writing them to the database in batches.
+
+    in_flight holds the batch taken off the queue but not yet written.
+    """
+    delay = 1.0
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < LEADERBOARD_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+        in_flight[:] = batch
+        retry = []
+        try:
+            response = await supabase.post("/rpc/submit_scores", json={"entries": batch})
+            response.raise_for_status()
+        except Exception as e:
+            retry = batch if _is_retryable(e) else await _write_rows(supabase, batch)
+        finally:
+            # Put retries back before marking the batch done, so join() keeps waiting for them
+            for item in retry:
+                queue.put_nowait(item)
+            in_flight.clear()
+            for _ in batch:
+                queue.task_done()
+        if retry:
+            logger.warning("Failed to write %d leaderboard entries; retrying in %.0fs", len(retry), delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, LEADERBOARD_RETRY_MAX_DELAY)
+        else:
+            delay = 1.0
 
 @app.get("/leaderboard")
-def get_leaderboard():
+async def get_leaderboard(request: Request):
     """Get today's leaderboard"""
     today_key = get_today_key()
-    supabase = get_supabase()
+    supabase = get_supabase(request)
     
     if not supabase:
         return {"entries": [], "date": today_key, "error": "Database not configured"}
     
     try:
-        response = supabase.table("leaderboard").select("*").eq("date_key", today_key).execute()
-        entries = response.data or []
-        # Sort by: won first (True before False), then by tries (ascending)
-        sorted_entries = sorted(entries, key=lambda x: (not x["won"], x["tries"]))
-        return {"entries": sorted_entries, "date": today_key}
+        leaderboard = await get_todays_leaderboard(supabase, today_key)
     except Exception as e:
         return {"entries": [], "date": today_key, "error": str(e)}
 
+    # Let polling clients and proxies revalidate instead of re-downloading
+    headers = {"ETag": leaderboard["etag"], "Cache-Control": f"max-age={int(LEADERBOARD_TTL)}"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if leaderboard["etag"] in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=leaderboard["body"], media_type="application/json", headers=headers)
+
 @app.post("/leaderboard")
-def add_to_leaderboard(entry: LeaderboardEntry):
+async def add_to_leaderboard(entry: LeaderboardEntry, request: Request, response: Response):
     """Add a player to today's leaderboard"""
     today_key = get_today_key()
-    supabase = get_supabase()
+    supabase = get_supabase(request)
     
     if not supabase:
         return {"entries": [], "date": today_key, "error": "Database not configured"}
     
+    new_entry = {"name": entry.name.strip(), "tries": entry.tries, "won": entry.won}
+    queue = getattr(request.app.state, "lb_queue", None)
+    if queue is not None:
+        # A background writer owns the database write
+        await queue.put({**new_entry, "date_key": today_key})
+        response.status_code = 202
+    else:
+        try:
+            new_entry = await submit_score(supabase, today_key, new_entry)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    
     try:
-        # Add the new entry
-        supabase.table("leaderboard").insert({
-            "name": entry.name.strip(),
-            "tries": entry.tries,
-            "won": entry.won,
-            "date_key": today_key
-        }).execute()
-        
-        # Fetch updated leaderboard
-        response = supabase.table("leaderboard").select("*").eq("date_key", today_key).execute()
-        entries = response.data or []
-        sorted_entries = sorted(entries, key=lambda x: (not x["won"], x["tries"]))
-        return {"entries": sorted_entries, "date": today_key}
+        # Merge it into the cached leaderboard so the player sees it straight away
+        entries = await merge_into_leaderboard(supabase, today_key, new_entry)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        # The entry is already saved or queued, so don't report the submission as failed
+        logger.exception("Failed to refresh the leaderboard after a submission")
+        return {"entries": [new_entry], "date": today_key, "error": str(e)}
+    return {"entries": entries, "date": today_key}
@@ -0,0 +1,73 @@
+import json
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import main
+
+
+class FakeSupabase:
+    """In-memory stand-in for the leaderboard's PostgREST endpoints"""
+
+    def __init__(self):
+        self.rows = []
+        self.calls = []
+        # Names the database answers with 400, and how many writes to fail with 503
+        self.reject = set()
+        self.unavailable = 0
+
+    def _upsert(self, item):
+        for row in self.rows:
+            if row["date_key"] == item["date_key"] and row["name"].lower() == item["name"].lower():
+                if (not item["won"], item["tries"]) < (not row["won"], row["tries"]):
+                    row.update(won=item["won"], tries=item["tries"])
+                return row
+        row = {k: item[k] for k in ("name", "tries", "won", "date_key")}
+        self.rows.append(row)
+        return row
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix("/rest/v1")
+        self.calls.append((request.method, path))
+        if request.method == "GET":
+            date_key = request.url.params["date_key"].removeprefix("eq.")
+            rows = sorted(
+                (r for r in self.rows if r["date_key"] == date_key),
+                key=lambda r: (not r["won"], r["tries"]),
+            )
+            return httpx.Response(200, json=[{k: r[k] for k in ("name", "tries", "won")} for r in rows])
+
+        body = json.loads(request.content)
+        if path == "/rpc/submit_scores":
+            items = body["entries"]
+        else:
+            items = [{k.removeprefix("p_"): v for k, v in body.items()}]
+        if self.unavailable:
+            self.unavailable -= 1
+            return httpx.Response(503, json={"message": "unavailable"})
+        if any(item["name"] in self.reject for item in items):
+            return httpx.Response(400, json={"message": "rejected"})
+        rows = [self._upsert(item) for item in items]
+        return httpx.Response(200, json=[{k: r[k] for k in ("name", "tries", "won")} for r in rows])
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(base_url="http://supabase/rest/v1", transport=httpx.MockTransport(self.handler))
+
+
+@pytest.fixture
+def fake_supabase(monkeypatch):
+    fake = FakeSupabase()
+    monkeypatch.setattr(main, "create_supabase_client", fake.client)
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def reset_leaderboard(monkeypatch):
+    monkeypatch.setattr(main, "_LEADERBOARD", dict(main._LEADERBOARD, key=None))
+    monkeypatch.setattr(main, "_LEADERBOARD_REFRESH", (None, None))
+    monkeypatch.setattr(main, "_LEADERBOARD_LOCK", (None, None))
+    monkeypatch.setattr(main, "LEADERBOARD_WRITE_BEHIND", False)
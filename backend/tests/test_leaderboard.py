@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+def submit(client, name, tries, won=True):
+    return client.post("/leaderboard", json={"name": name, "tries": tries, "won": won})
+
+
+def test_submission_merges_best_result_by_lowercased_name(fake_supabase):
+    with TestClient(main.app) as client:
+        submit(client, "Alice", 5)
+        submit(client, "bob", 4)
+        response = submit(client, "ALICE", 3)
+        assert response.status_code == 200
+        assert response.json()["entries"] == [
+            {"name": "Alice", "tries": 3, "won": True},
+            {"name": "bob", "tries": 4, "won": True},
+        ]
+
+        # A worse result doesn't replace the player's best one
+        response = submit(client, "alice", 6, won=False)
+        assert response.json()["entries"][0] == {"name": "Alice", "tries": 3, "won": True}
+        assert client.get("/leaderboard").json()["entries"] == response.json()["entries"]
+
+
+def test_get_returns_304_for_matching_etag(fake_supabase):
+    with TestClient(main.app) as client:
+        submit(client, "alice", 3)
+        response = client.get("/leaderboard")
+        etag = response.headers["etag"]
+        assert response.status_code == 200
+
+        response = client.get("/leaderboard", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        submit(client, "bob", 2)
+        response = client.get("/leaderboard", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+
+def test_concurrent_refreshes_share_one_fetch():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.1)
+        return httpx.Response(500, json={"message": "down"})
+
+    async def run():
+        async with httpx.AsyncClient(base_url="http://supabase/rest/v1", transport=httpx.MockTransport(handler)) as client:
+            return await asyncio.gather(
+                *(main.get_todays_leaderboard(client, "2026-01-01") for _ in range(6)),
+                return_exceptions=True,
+            )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, httpx.HTTPStatusError) for r in results)
+    assert len(calls) == 1
+
+
+def test_rejected_entry_does_not_block_later_writes(fake_supabase, monkeypatch):
+    monkeypatch.setattr(main, "LEADERBOARD_WRITE_BEHIND", True)
+    fake_supabase.reject.add("mallory")
+    with TestClient(main.app) as client:
+        for name in ("mallory", "x", "y", "z"):
+            assert submit(client, name, 3).status_code == 202
+    # Leaving the client runs shutdown, which waits for the queue to drain
+    assert sorted(row["name"] for row in fake_supabase.rows) == ["x", "y", "z"]
+
+
+def test_unavailable_database_is_retried(fake_supabase, monkeypatch):
+    monkeypatch.setattr(main, "LEADERBOARD_WRITE_BEHIND", True)
+    fake_supabase.unavailable = 1
+    with TestClient(main.app) as client:
+        assert submit(client, "alice", 3).status_code == 202
+    assert [row["name"] for row in fake_supabase.rows] == ["alice"]
+    assert fake_supabase.calls.count(("POST", "/rpc/submit_scores")) == 2
+
+
+@pytest.mark.parametrize("entry", [
+    {"name": "alice", "tries": 2**40, "won": True},
+    {"name": "alice", "tries": 0, "won": True},
+    {"name": "", "tries": 3, "won": True},
+    {"name": "a" * 21, "tries": 3, "won": True},
+])
+def test_malformed_entries_are_rejected(fake_supabase, entry):
+    with TestClient(main.app) as client:
+        assert client.post("/leaderboard", json=entry).status_code == 422
+    assert fake_supabase.rows == []
@@ -0,0 +1,36 @@
+-- Today's leaderboard is read in display order, so serve it from an index range scan
+create index if not exists lb_daily on leaderboard (date_key, won desc, tries asc);
+
+-- Keep each player's best result per day before enforcing one row per name
+delete from leaderboard a
+using leaderboard b
+where a.date_key = b.date_key
+  and lower(a.name) = lower(b.name)
+  and (a.won, -a.tries, a.ctid) < (b.won, -b.tries, b.ctid);
+
+create unique index if not exists lb_dedup on leaderboard (date_key, lower(name));
+
+-- Record a result, keeping the player's best one for the day (a win beats a loss,
+-- then fewer tries wins). Returns the stored row.
+create or replace function submit_score(
+  p_name leaderboard.name%type,
+  p_tries leaderboard.tries%type,
+  p_won leaderboard.won%type,
+  p_date_key leaderboard.date_key%type
+)
+returns setof leaderboard
+language sql
+security definer
+set search_path = public
+as $$
+  insert into leaderboard (name, tries, won, date_key)
+  values (p_name, p_tries, p_won, p_date_key)
+  on conflict (date_key, lower(name)) do update
+    set won = leaderboard.won or excluded.won,
+        tries = case
+          when excluded.won = leaderboard.won then least(leaderboard.tries, excluded.tries)
+          when excluded.won then excluded.tries
+          else leaderboard.tries
+        end
+  returning *;
+$$;
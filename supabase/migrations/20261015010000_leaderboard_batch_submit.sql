@@ -0,0 +1,22 @@
+-- Record a batch of results in one statement, with the same best-result rules as
+-- submit_score(). Duplicates within the batch are collapsed to the best one first,
+-- since a single upsert can't touch the same row twice.
+create or replace function submit_scores(entries jsonb)
+returns setof leaderboard
+language sql
+security definer
+set search_path = public
+as $$
+  insert into leaderboard (name, tries, won, date_key)
+  select distinct on (e.date_key, lower(e.name)) e.name, e.tries, e.won, e.date_key
+  from jsonb_populate_recordset(null::leaderboard, entries) as e
+  order by e.date_key, lower(e.name), e.won desc, e.tries asc
+  on conflict (date_key, lower(name)) do update
+    set won = leaderboard.won or excluded.won,
+        tries = case
+          when excluded.won = leaderboard.won then least(leaderboard.tries, excluded.tries)
+          when excluded.won then excluded.tries
+          else leaderboard.tries
+        end
+  returning *;
+$$;
@@ -0,0 +1,7 @@
+-- submit_score() and submit_scores() are security definer, so they bypass RLS.
+-- Only the backend may call them; it connects with the service_role key.
+revoke execute on function submit_score from public, anon, authenticated;
+revoke execute on function submit_scores from public, anon, authenticated;
+
+grant execute on function submit_score to service_role;
+grant execute on function submit_scores to service_role;